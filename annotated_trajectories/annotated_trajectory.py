@@ -1,8 +1,20 @@
 from collections import namedtuple
+import csv
+import io
+import math
+import os
+import random
+import threading
+import numpy as np
 import matplotlib.pyplot as plt
 import openpathsampling as paths
 from openpathsampling.netcdfplus import StorableNamedObject
 
+try:
+    _string_types = (basestring,)  # Python 2: str and unicode
+except NameError:
+    _string_types = (str, bytes)
+
 # this hack of making a class from my namedtuple allows me to give it a
 # docstring
 class Annotation(namedtuple('Annotation', ['state', 'begin', 'end'])):
@@ -20,6 +32,20 @@ class Annotation(namedtuple('Annotation', ['state', 'begin', 'end'])):
         the final frame that is labelled as in the state (inclusive)
     """
 
+class AnnotationConflict(namedtuple('AnnotationConflict',
+                                    ['annotation', 'conflicts_with'])):
+    """
+    Conflict found during bulk annotation ingest.
+
+    Parameters
+    ----------
+    annotation : :class:`.Annotation`
+        the new annotation that was rejected
+    conflicts_with : :class:`.Annotation`
+        an annotation (new or already present) that shares at least one
+        frame with ``annotation``
+    """
+
 _validation_fields = ['correct', 'false_positive', 'false_negative']
 class ValidationResults(namedtuple('ValidationResults', _validation_fields)):
     """
@@ -48,6 +74,74 @@ class ValidationResults(namedtuple('ValidationResults', _validation_fields)):
                 + "False positive: " + str(len(self.false_positive)) + "\n"
                 + "False negative: " + str(len(self.false_negative)))
 
+class Estimate(namedtuple('Estimate', ['rate', 'lower', 'upper'])):
+    """
+    Estimated fraction of trajectory frames, with confidence interval.
+
+    Parameters
+    ----------
+    rate : float
+        the estimated fraction of all frames in the trajectory
+    lower : float
+        lower bound of the confidence interval
+    upper : float
+        upper bound of the confidence interval
+    """
+    @property
+    def half_width(self):
+        return 0.5 * (self.upper - self.lower)
+
+
+_sampled_validation_fields = _validation_fields + ['n_sampled']
+class SampledValidationResults(namedtuple('SampledValidationResults',
+                                          _sampled_validation_fields)):
+    """
+    Object returned by sampled validation.
+
+    Like :class:`.ValidationResults`, but estimated from a stratified
+    sample of frames instead of from every frame. Each rate is the fraction
+    of all frames in the trajectory that fall in that category, so
+    multiplying by the length of the trajectory gives an estimated count.
+
+    Parameters
+    ----------
+    correct : :class:`.Estimate`
+        fraction of frames correctly identified as in the state
+    false_positive : :class:`.Estimate`
+        fraction of frames identified as in the state by the volume, but
+        not by the annotation
+    false_negative : :class:`.Estimate`
+        fraction of frames in the state according to the annotation, but
+        not according to the volume
+    n_sampled : int
+        number of frames on which the volume was evaluated
+    """
+    def __str__(self):  # pragma: no cover
+        return "\n".join(
+            "{name}: {e.rate:.4f} [{e.lower:.4f}, {e.upper:.4f}]".format(
+                name=name, e=getattr(self, field)
+            )
+            for name, field in [("Correct", 'correct'),
+                                ("False positive", 'false_positive'),
+                                ("False negative", 'false_negative')]
+        ) + "\nSampled frames: " + str(self.n_sampled)
+
+
+def _z_score(confidence):
+    """Two-sided standard normal quantile for the given confidence."""
+    if not 0.0 < confidence < 1.0:
+        raise ValueError("Confidence must be between 0 and 1")
+    # bisection on the normal CDF; avoids a scipy dependency
+    (low, high) = (0.0, 40.0)
+    for _ in range(100):
+        mid = 0.5 * (low + high)
+        if math.erf(mid / math.sqrt(2.0)) < confidence:
+            low = mid
+        else:
+            high = mid
+    return 0.5 * (low + high)
+
+
 class AnnotatedTrajectory(StorableNamedObject):
     """Trajectory with state annotations.
 
@@ -65,6 +159,7 @@ class AnnotatedTrajectory(StorableNamedObject):
         self.annotations = set([])
         self._frame_map = [None]*len(self.trajectory)
         self._annotation_dict = {}
+        self._in_state_cache = {}
         if annotations is not None:
             self.add_annotations(annotations)
 
@@ -107,6 +202,209 @@ class AnnotatedTrajectory(StorableNamedObject):
             else:
                 self._annotation_dict[state] = [range_tuple]
 
+    def add_annotations_from_arrays(self, labels, begins, ends):
+        """
+        Add many annotations at once. Do not do this after saving!
+
+        Unlike :meth:`.add_annotations`, overlaps are not an error: the
+        whole batch (together with the existing annotations) is sorted and
+        checked for overlaps in one pass. Every new annotation that shares a
+        frame with any other annotation is rejected and reported; all other
+        annotations are added.
+
+        Parameters
+        ----------
+        labels : 1D array-like of str
+            the state name for each annotation; bytes are decoded as UTF-8,
+            and anything else (e.g., None or NaN for a missing label) is an
+            error
+        begins : 1D array-like of int
+            the initial frame for each annotation
+        ends : 1D array-like of int
+            the final frame for each annotation (inclusive)
+
+        Returns
+        -------
+        list of :class:`.AnnotationConflict`
+            every overlapping pair that involves a new annotation; empty if
+            all annotations were added
+        """
+        if isinstance(labels, (str, bytes)):
+            raise ValueError("labels must be a sequence of labels, not a "
+                             + "single string")
+        for (name, values) in [('labels', labels), ('begins', begins),
+                               ('ends', ends)]:
+            if np.ndim(values) != 1:
+                raise ValueError(name + " must be one-dimensional")
+        not_strings = [i for (i, label) in enumerate(labels)
+                       if not isinstance(label, _string_types)]
+        if not_strings:
+            raise ValueError("Labels must be strings; invalid labels for "
+                             + "annotations: " + str(not_strings))
+        labels = [label.decode('utf-8') if isinstance(label, bytes)
+                  else str(label) for label in labels]
+        begins = np.asarray(begins, dtype=int)
+        ends = np.asarray(ends, dtype=int)
+        if not len(labels) == len(begins) == len(ends):
+            raise ValueError("labels, begins, and ends must have the same "
+                             + "length")
+        bad = (begins > ends) | (begins < 0) | (ends >= len(self._frame_map))
+        if np.any(bad):
+            raise ValueError("Invalid frame ranges for annotations: "
+                             + str(np.flatnonzero(bad).tolist()))
+        new = [Annotation(state, int(begin), int(end))
+               for (state, begin, end) in zip(labels, begins, ends)]
+        existing = [Annotation(state, r[0], r[1])
+                    for (state, ranges) in self._annotation_dict.items()
+                    for r in ranges]
+
+        # sort all annotations by first frame; the annotations that overlap
+        # an annotation and come later in that order are exactly those that
+        # begin no later than its end, which form a contiguous block
+        all_begins = np.concatenate([
+            begins, np.array([a.begin for a in existing], dtype=int)
+        ])
+        all_ends = np.concatenate([
+            ends, np.array([a.end for a in existing], dtype=int)
+        ])
+        order = np.argsort(all_begins, kind='mergesort')
+        sorted_begins = all_begins[order]
+        positions = np.arange(len(order))
+        block_ends = np.searchsorted(sorted_begins, all_ends[order],
+                                     side='right')
+        n_later = np.maximum(block_ends - positions - 1, 0)
+        # enumerate each (earlier, later) pair, in O(number of pairs)
+        earlier = np.repeat(positions, n_later)
+        block_starts = np.repeat(np.cumsum(n_later) - n_later, n_later)
+        later = (np.arange(len(earlier)) - block_starts
+                 + np.repeat(positions + 1, n_later))
+
+        n_new = len(new)
+        all_annotations = new + existing
+        conflicts = []
+        rejected = set([])
+        for (idx, other) in zip(order[later], order[earlier]):
+            if idx >= n_new:
+                # an existing annotation can only conflict with a new one
+                (idx, other) = (other, idx)
+            rejected.add(idx)
+            if other < n_new:
+                rejected.add(other)
+            conflicts.append(AnnotationConflict(all_annotations[idx],
+                                                all_annotations[other]))
+
+        accepted = [a for (i, a) in enumerate(new) if i not in rejected]
+        self.annotations |= set(accepted)
+        for annotation in accepted:
+            (state, begin, end) = annotation
+            self._frame_map[begin:end+1] = [state]*(end - begin + 1)
+            self._annotation_dict.setdefault(state, []).append((begin, end))
+        return conflicts
+
+    def add_annotations_from_file(self, filename, delimiter=None):
+        """
+        Add annotations from a CSV/TSV file. Do not do this after saving!
+
+        Each row gives the state name, the initial frame, and the final
+        frame (inclusive). A header row is skipped if present. Rows with
+        the wrong number of columns or non-integer frames raise a
+        ``ValueError`` naming the line, before anything is added. See
+        :meth:`.add_annotations_from_arrays` for how overlaps are handled.
+
+        Parameters
+        ----------
+        filename : str
+            the file to read
+        delimiter : str
+            column delimiter; default is a tab for files ending in
+            ``.tsv`` and a comma otherwise
+
+        Returns
+        -------
+        list of :class:`.AnnotationConflict`
+            overlapping pairs found; empty if all annotations were added
+        """
+        if delimiter is None:
+            ext = os.path.splitext(filename)[1].lower()
+            delimiter = '\t' if ext == '.tsv' else ','
+        (labels, begins, ends) = ([], [], [])
+        with io.open(filename, newline='') as f:
+            reader = csv.reader(f, delimiter=delimiter)
+            for row in reader:
+                if not row:
+                    continue
+                if len(row) != 3:
+                    raise ValueError(
+                        "{0}, line {1}: expected 3 columns, found {2}".format(
+                            filename, reader.line_num, len(row)
+                        )
+                    )
+                try:
+                    (begin, end) = (int(row[1]), int(row[2]))
+                except ValueError:
+                    if reader.line_num == 1:
+                        continue  # header
+                    raise ValueError(
+                        "{0}, line {1}: frame numbers must be integers, "
+                        "found {2!r}".format(filename, reader.line_num,
+                                             row[1:])
+                    )
+                labels.append(row[0].strip())
+                begins.append(begin)
+                ends.append(end)
+        return self.add_annotations_from_arrays(labels, begins, ends)
+
+    def append_frames(self, frames, annotations=None):
+        """
+        Extend the trajectory with new frames. Do not do this after saving!
+
+        This is intended for trajectories that are still being extended by
+        a running simulation. The trajectory object is extended in place,
+        so the cost depends only on the number of new frames. Results from
+        incremental validation (see :meth:`.validate_states`) are carried
+        forward, so that only the new frames need to be evaluated.
+
+        Parameters
+        ----------
+        frames : ``paths.Trajectory`` or list of ``paths.Snapshot``
+            the frames to append
+        annotations : :class:`.Annotation` or list of :class:`.Annotation`
+            annotations to add after the frames have been appended; frame
+            numbers refer to the extended trajectory. If any of these
+            cannot be added, ``ValueError`` is raised and nothing is
+            changed.
+        """
+        frames = list(frames)
+        if annotations is not None:
+            if isinstance(annotations, Annotation):
+                annotations = [annotations]
+            self._check_new_annotations(annotations,
+                                        len(self._frame_map) + len(frames))
+        self.trajectory.extend(frames)
+        self._frame_map += [None]*len(frames)
+        if annotations is not None:
+            self.add_annotations(annotations)
+
+    def _check_new_annotations(self, annotations, n_frames):
+        """Raise ValueError if annotations can't be added to n_frames frames.
+
+        Only looks at the frames covered by the new annotations, so the
+        cost does not depend on the length of the trajectory.
+        """
+        claimed = set([])
+        for annotation in annotations:
+            (begin, end) = (annotation.begin, annotation.end)
+            if not 0 <= begin <= end < n_frames:
+                raise ValueError("Invalid frame range for annotation: "
+                                 + str(annotation))
+            for frame_num in range(begin, end+1):
+                existing = (self._frame_map[frame_num]
+                            if frame_num < len(self._frame_map) else None)
+                if frame_num in claimed or existing is not None:
+                    raise ValueError("Cannot assign frame to more than one "
+                                     + "state")
+                claimed.add(frame_num)
+
     def get_all_frames(self, label):
         """Return all frames for a given label as a flattened trajectory.
 
@@ -196,7 +494,30 @@ class AnnotatedTrajectory(StorableNamedObject):
     def state_names(self):
         return list(self._annotation_dict.keys())
 
-    def _validation_idxs(self, state, state_annotations):
+    def _in_state_idxs(self, state, start=0):
+        """Frame indices (from ``start`` on) that are in the volume"""
+        return set([i for i in range(start, len(self.trajectory))
+                    if state(self.trajectory[i])])
+
+    def _cached_in_state_idxs(self, state_name, state):
+        """
+        Frame indices in the volume, only evaluating frames added since the
+        last call for this state name. The cache is reset if the volume for
+        this state name changes.
+        """
+        try:
+            (cached_state, in_state, n_evaluated) = \
+                    self._in_state_cache[state_name]
+        except KeyError:
+            cached_state = None
+        if cached_state is not state:
+            (in_state, n_evaluated) = (set([]), 0)
+        in_state |= self._in_state_idxs(state, start=n_evaluated)
+        self._in_state_cache[state_name] = (state, in_state,
+                                            len(self.trajectory))
+        return in_state
+
+    def _validation_idxs(self, state, state_annotations, in_state=None):
         """
         Find indexes of snapshots labeled correctly, false positive, false
         negative.
@@ -210,6 +531,9 @@ class AnnotatedTrajectory(StorableNamedObject):
             the proposed state volume for this particular state
         state_annotations : list of 2-tuple
             list of first and final frame from each annotation for the state
+        in_state : set of int
+            frame indices that are in the proposed state volume, if already
+            known; otherwise, the volume is evaluated on every frame
 
         Returns
         -------
@@ -224,20 +548,35 @@ class AnnotatedTrajectory(StorableNamedObject):
         """
         expected = set(sum([list(range(a[0], a[1]+1))
                             for a in state_annotations], []))
-        in_state = set([i for i in range(len(self.trajectory))
-                        if state(self.trajectory[i])])
+        if in_state is None:
+            in_state = self._in_state_idxs(state)
         correct_idxs = expected & in_state
         false_pos_idxs = in_state - expected
         false_neg_idxs = expected - in_state
         return (correct_idxs, false_pos_idxs, false_neg_idxs)
 
-    def validate_states(self, names_to_volumes):
+    def _check_volume_keys(self, names_to_volumes):
+        """Ensure that annotation labels and proposed states match."""
+        label_keys = set(self.state_names)
+        volume_keys = set(names_to_volumes.keys())
+        if len(label_keys - volume_keys) > 0:
+            raise RuntimeError("Annotation labels have no proposed state: "
+                               + str([l for l in label_keys - volume_keys]))
+        elif len(volume_keys - label_keys) > 0:
+            raise RuntimeError("Proposed states have no annotations: "
+                               + str([l for l in volume_keys - label_keys]))
+
+    def validate_states(self, names_to_volumes, incremental=False):
         """Compare proposed state definitions to annotations.
 
         Parameters
         ----------
         names_to_volumes : dict {str: ``paths.Volume``}
             dictionary linking label names to proposed state volumes
+        incremental : bool
+            if True, remember which frames are in each volume, and on later
+            incremental calls only evaluate the volumes on frames added
+            (with :meth:`.append_frames`) since then. Default False.
 
         Returns
         -------
@@ -250,33 +589,409 @@ class AnnotatedTrajectory(StorableNamedObject):
             annotated label is different from the result of the proposed
             state.
         """
-        label_keys = set(self.state_names)
-        volume_keys = set(names_to_volumes.keys())
-        if len(label_keys - volume_keys) > 0:
-            raise RuntimeError("Annotation labels have no proposed state: "
-                               + str([l for l in label_keys - volume_keys]))
-        elif len(volume_keys - label_keys) > 0:
-            raise RuntimeError("Proposed states have no annotations: "
-                               + str([l for l in volume_keys - label_keys]))
+        self._check_volume_keys(names_to_volumes)
         results = {}
         conflicts = {}
         for state_name in self._annotation_dict:
-            state_annotations = self._annotation_dict[state_name]
             state = names_to_volumes[state_name]
-            idxs = self._validation_idxs(state, state_annotations)
-            correct = [self.trajectory[i] for i in sorted(idxs[0])]
-            false_pos = [self.trajectory[i] for i in sorted(idxs[1])]
-            false_neg = [self.trajectory[i] for i in sorted(idxs[2])]
-            results.update({
-                state_name: ValidationResults(correct=correct,
-                                              false_positive=false_pos,
-                                              false_negative=false_neg)
-            })
-            conflicts[state_name] = [i for i in idxs[1]  # false pos idxs
-                                     if self._frame_map[i] is not None]
+            if incremental:
+                in_state = self._cached_in_state_idxs(state_name, state)
+            else:
+                in_state = None
+            (results[state_name], conflicts[state_name]) = \
+                    self._state_validation(state_name, state, in_state)
+
+        return (results, conflicts)
 
+    def validate_states_async(self, names_to_volumes):
+        """Compare proposed state definitions to annotations in the
+        background.
+
+        Volumes are evaluated in a background thread, so that (e.g.) a
+        notebook kernel stays responsive during long validations. The
+        returned job reports progress, can be cancelled, and can be awaited
+        (Python 3) or waited on with :meth:`.ValidationJob.result`.
+
+        Parameters
+        ----------
+        names_to_volumes : dict {str: ``paths.Volume``}
+            dictionary linking label names to proposed state volumes
+
+        Returns
+        -------
+        :class:`.ValidationJob`
+            the running job; its result is the same as the return value of
+            :meth:`.validate_states`
+        """
+        self._check_volume_keys(names_to_volumes)
+        job = ValidationJob(self, names_to_volumes)
+        job.start()
+        return job
+
+    def _state_validation(self, state_name, state, in_state=None):
+        """
+        Validation results and conflicts for a single state.
+
+        Parameters
+        ----------
+        state_name : str
+            the annotation label for this state
+        state : ``paths.Volume``
+            the proposed state volume for this state
+        in_state : set of int
+            frame indices that are in the proposed state volume, if already
+            known
+
+        Returns
+        -------
+        results : :class:`.ValidationResults`
+            the validation results for this state
+        conflicts : list of int
+            frames where the annotated label is different from the result
+            of the proposed state
+        """
+        state_annotations = self._annotation_dict[state_name]
+        idxs = self._validation_idxs(state, state_annotations, in_state)
+        return self._results_from_idxs(self.trajectory, self._frame_map,
+                                       idxs)
+
+    @staticmethod
+    def _results_from_idxs(trajectory, frame_map, idxs):
+        """Build validation results from the output of _validation_idxs.
+
+        Takes the trajectory and frame map explicitly so that a
+        :class:`.ValidationJob` can use its own copies.
+        """
+        correct = [trajectory[i] for i in sorted(idxs[0])]
+        false_pos = [trajectory[i] for i in sorted(idxs[1])]
+        false_neg = [trajectory[i] for i in sorted(idxs[2])]
+        results = ValidationResults(correct=correct,
+                                    false_positive=false_pos,
+                                    false_negative=false_neg)
+        conflicts = [i for i in idxs[1]  # false pos idxs
+                     if frame_map[i] is not None]
         return (results, conflicts)
 
+    def _strata(self):
+        """Frame indices grouped by label; unassigned frames under None"""
+        strata = {label: [] for label in self.state_names}
+        strata[None] = []
+        for (idx, label) in enumerate(self._frame_map):
+            strata[label].append(idx)
+        return {label: idxs for (label, idxs) in strata.items() if idxs}
+
+    @staticmethod
+    def _allocate_samples(strata, n_frames):
+        """Proportional allocation of the frame budget, at least 1 each.
+
+        Rounding and the one-frame minimum can overshoot the budget; the
+        excess is taken back from the largest allocations. The budget can
+        only be exceeded if it is smaller than the number of strata.
+        """
+        n_total = sum(len(idxs) for idxs in strata.values())
+        allocation = {
+            label: min(len(idxs),
+                       max(1, int(round(float(n_frames) * len(idxs)
+                                        / n_total))))
+            for (label, idxs) in strata.items()
+        }
+        excess = sum(allocation.values()) - max(n_frames, len(strata))
+        while excess > 0:
+            largest = max(allocation, key=lambda label: allocation[label])
+            allocation[largest] -= 1
+            excess -= 1
+        return allocation
+
+    @staticmethod
+    def _stratified_estimate(terms, z):
+        """Combine per-stratum samples into a stratified estimate.
+
+        Parameters
+        ----------
+        terms : list of 4-tuple (int, int, int, int)
+            for each contributing stratum, the size of the stratum, the
+            total number of frames, the number of frames sampled, and the
+            number of sampled frames that are "hits"
+        z : float
+            standard normal quantile for the confidence interval
+
+        Returns
+        -------
+        :class:`.Estimate`
+        """
+        rate = 0.0
+        variance = 0.0
+        for (n_stratum, n_total, n_sampled, n_hits) in terms:
+            weight = float(n_stratum) / n_total
+            rate += weight * n_hits / n_sampled
+            # the (x+1)/(n+2) adjustment keeps all-hit or no-hit samples
+            # from claiming zero variance; the finite population correction
+            # makes an exhaustively sampled stratum exact
+            p_adj = (n_hits + 1.0) / (n_sampled + 2.0)
+            fpc = 1.0 - float(n_sampled) / n_stratum
+            variance += weight**2 * p_adj * (1.0 - p_adj) / n_sampled * fpc
+        half_width = z * math.sqrt(variance)
+        return Estimate(rate=rate, lower=max(0.0, rate - half_width),
+                        upper=min(1.0, rate + half_width))
+
+    def validate_states_sampled(self, names_to_volumes, n_frames=None,
+                                precision=None, confidence=0.95, seed=None):
+        """Estimate validation rates from a stratified sample of frames.
+
+        Frames are sampled separately from each annotated label and from
+        the unassigned frames, and the proposed volumes are only evaluated
+        on the sampled frames. If ``precision`` is given, the sample is
+        progressively doubled (reusing frames already evaluated) until
+        every confidence interval has a half-width no larger than
+        ``precision``, or until every frame has been sampled.
+
+        Parameters
+        ----------
+        names_to_volumes : dict {str: ``paths.Volume``}
+            dictionary linking label names to proposed state volumes
+        n_frames : int
+            maximum number of frames sampled (but at least one frame is
+            always sampled from each stratum); if ``precision`` is also
+            given, this is the size of the initial sample. Default (only
+            allowed with ``precision``) is 10 frames per stratum.
+        precision : float
+            target half-width of the confidence intervals, as a fraction of
+            all frames
+        confidence : float
+            confidence level for the intervals, default 0.95
+        seed : int
+            seed for the random selection of frames
+
+        Returns
+        -------
+        dict {str: :class:`.SampledValidationResults`}
+            dictionary linking label name to the estimated results of
+            validation
+        """
+        if n_frames is None and precision is None:
+            raise ValueError("Must give at least one of n_frames and "
+                             "precision")
+        if n_frames is not None and n_frames < 1:
+            raise ValueError("n_frames must be at least 1")
+        self._check_volume_keys(names_to_volumes)
+        z = _z_score(confidence)
+        rng = random.Random(seed)
+        strata = {label: rng.sample(idxs, len(idxs))
+                  for (label, idxs) in self._strata().items()}
+        n_total = len(self._frame_map)
+        if n_frames is None:
+            n_frames = 10 * len(strata)
+
+        in_state = {name: {} for name in names_to_volumes}
+
+        def sampled_hits(state_name, label, n_sampled):
+            volume = names_to_volumes[state_name]
+            cache = in_state[state_name]
+            hits = 0
+            for idx in strata[label][:n_sampled]:
+                if idx not in cache:
+                    cache[idx] = bool(volume(self.trajectory[idx]))
+                hits += cache[idx]
+            return hits
+
+        while True:
+            allocation = self._allocate_samples(strata, n_frames)
+            results = {}
+            for state_name in names_to_volumes:
+                hits = {label: sampled_hits(state_name, label, n)
+                        for (label, n) in allocation.items()}
+                own = [(len(strata[state_name]), n_total,
+                        allocation[state_name], hits[state_name])]
+                missed = [(n_stratum, n_total, n_sampled,
+                           n_sampled - n_hits)
+                          for (n_stratum, _, n_sampled, n_hits) in own]
+                others = [(len(strata[label]), n_total, allocation[label],
+                           hits[label])
+                          for label in allocation if label != state_name]
+                results[state_name] = SampledValidationResults(
+                    correct=self._stratified_estimate(own, z),
+                    false_positive=self._stratified_estimate(others, z),
+                    false_negative=self._stratified_estimate(missed, z),
+                    n_sampled=len(in_state[state_name])
+                )
+
+            if precision is None or n_frames >= n_total:
+                break
+            worst = max(getattr(res, field).half_width
+                        for res in results.values()
+                        for field in _validation_fields)
+            if worst <= precision:
+                break
+            n_frames = min(2 * n_frames, n_total)
+
+        return results
+
+
+class ValidationJob(object):
+    """Validation running in a background thread.
+
+    Created by :meth:`.AnnotatedTrajectory.validate_states_async`. Each
+    proposed volume is evaluated in turn over the frames that were in the
+    trajectory when the job was created, and compared to the annotations
+    as they were at that time; frames and annotations added while the job
+    runs do not affect its results.
+
+    A thread (rather than a process pool) is used because volumes and
+    snapshots are arbitrary Python objects that are not guaranteed to be
+    picklable; the evaluation loop still yields the interpreter often
+    enough to keep the calling thread responsive.
+
+    Parameters
+    ----------
+    annotated : :class:`.AnnotatedTrajectory`
+        the annotated trajectory to validate
+    names_to_volumes : dict {str: ``paths.Volume``}
+        dictionary linking label names to proposed state volumes
+    """
+    def __init__(self, annotated, names_to_volumes):
+        self.annotated = annotated
+        # copies, so the user can keep annotating (or editing their dict of
+        # volumes) while the job runs
+        self.names_to_volumes = dict(names_to_volumes)
+        self.trajectory = annotated.trajectory
+        self.n_frames = len(self.trajectory)
+        self._frame_map = list(annotated._frame_map[:self.n_frames])
+        self._annotation_ranges = {
+            name: [(begin, min(end, self.n_frames - 1))
+                   for (begin, end) in ranges if begin < self.n_frames]
+            for (name, ranges) in annotated._annotation_dict.items()
+        }
+        self._frames_done = {name: 0 for name in names_to_volumes}
+        self._results = {}
+        self._conflicts = {}
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._finished = False
+        self._was_cancelled = False
+        # imported here so the module stays importable on Python 2.7
+        # without the futures backport; only background jobs need it
+        import concurrent.futures
+        self._future = concurrent.futures.Future()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        """Start the background thread"""
+        # once running, the future can't be cancelled from outside (e.g., by
+        # cancelling a task that awaits it); use :meth:`.cancel` instead
+        self._future.set_running_or_notify_cancel()
+        self._thread.start()
+
+    def _run(self):
+        import concurrent.futures
+        try:
+            self._validate_all()
+        except Exception as e:
+            with self._lock:
+                self._finished = True
+            self._future.set_exception(e)
+            return
+        # decide the outcome under the lock, so that cancel() returns True
+        # exactly when the job ends up cancelled
+        with self._lock:
+            self._finished = True
+            self._was_cancelled = self._cancel_event.is_set()
+        if self._was_cancelled:
+            self._future.set_exception(concurrent.futures.CancelledError())
+        else:
+            self._future.set_result(self.partial_results())
+
+    def _validate_all(self):
+        """Validate each state in turn; stop early if cancelled"""
+        for state_name in sorted(self.names_to_volumes):
+            state = self.names_to_volumes[state_name]
+            in_state = set([])
+            for i in range(self.n_frames):
+                if self._cancel_event.is_set():
+                    return
+                if state(self.trajectory[i]):
+                    in_state.add(i)
+                self._frames_done[state_name] = i + 1
+            idxs = self.annotated._validation_idxs(
+                state, self._annotation_ranges[state_name], in_state
+            )
+            (results, conflicts) = AnnotatedTrajectory._results_from_idxs(
+                self.trajectory, self._frame_map, idxs
+            )
+            with self._lock:
+                self._results[state_name] = results
+                self._conflicts[state_name] = conflicts
+
+    @property
+    def progress(self):
+        """dict {str: 2-tuple (int, int)} : frames done and total frames
+        for each state"""
+        return {name: (done, self.n_frames)
+                for (name, done) in self._frames_done.items()}
+
+    def done(self):
+        """Whether the job has finished (completed, cancelled, or failed)"""
+        return self._future.done()
+
+    def cancel(self):
+        """Request cancellation; the job stops before its next frame.
+
+        Returns
+        -------
+        bool
+            False if the job had already finished, True otherwise (in which
+            case the job will end cancelled)
+        """
+        with self._lock:
+            if self._finished:
+                return False
+            self._cancel_event.set()
+            return True
+
+    def cancelled(self):
+        """Whether the job ended because it was cancelled"""
+        with self._lock:
+            return self._was_cancelled
+
+    def partial_results(self):
+        """Results for the states that have been completely validated.
+
+        Returns
+        -------
+        results : dict {str: :class:`.ValidationResults`}
+            as in :meth:`.AnnotatedTrajectory.validate_states`, but only for
+            completed states
+        conflicts : dict {str: list of int}
+            as in :meth:`.AnnotatedTrajectory.validate_states`, but only for
+            completed states
+        """
+        with self._lock:
+            return (dict(self._results), dict(self._conflicts))
+
+    def result(self, timeout=None):
+        """Wait for the job to finish and return its results.
+
+        Parameters
+        ----------
+        timeout : float
+            maximum time to wait, in seconds; default (None) waits until
+            the job finishes. If it is exceeded,
+            ``concurrent.futures.TimeoutError`` is raised. If the job was
+            cancelled, ``concurrent.futures.CancelledError`` is raised.
+
+        Returns
+        -------
+        results : dict {str: :class:`.ValidationResults`}
+            as in :meth:`.AnnotatedTrajectory.validate_states`
+        conflicts : dict {str: list of int}
+            as in :meth:`.AnnotatedTrajectory.validate_states`
+        """
+        return self._future.result(timeout)
+
+    def __await__(self):
+        import asyncio  # Python 3 only
+        return asyncio.wrap_future(self._future).__await__()
+
 
 def plot_annotated(trajectory, cv, names_to_volumes, names_to_colors, dt=1.0):
     """Plot annotated trajectory, marking annotations and proposed volumes.
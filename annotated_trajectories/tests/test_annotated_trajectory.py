@@ -4,6 +4,7 @@ from annotated_trajectories import *
 import pytest
 
 import os
+import threading
 from pkg_resources import resource_filename
 
 # TODO: when OPS no longer imports nose
@@ -36,6 +37,28 @@ def make_1d_traj(coordinates, velocities=None, engine=None):
         traj.append(snap)
     return paths.Trajectory(traj)
 
+class CountingVolume(object):
+    # wraps a volume to count how many times it is evaluated
+    def __init__(self, volume):
+        self.volume = volume
+        self.n_calls = 0
+
+    def __call__(self, snapshot):
+        self.n_calls += 1
+        return self.volume(snapshot)
+
+class BlockingVolume(object):
+    # wraps a volume so that evaluation waits until released
+    def __init__(self, volume):
+        self.volume = volume
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, snapshot):
+        self.started.set()
+        self.release.wait()
+        return self.volume(snapshot)
+
 def data_filename(fname):
     return resource_filename('annotated_trajectories',
                              os.path.join('tests', fname))
@@ -121,6 +144,114 @@ class TestAnnotatedTrajectory(object):
         with pytest.raises(ValueError):
             annotated = AnnotatedTrajectory(self.traj, bad_annotations)
 
+    def test_add_annotations_from_arrays(self):
+        labels = np.array([a.state for a in self.annotations])
+        begins = np.array([a.begin for a in self.annotations])
+        ends = np.array([a.end for a in self.annotations])
+        conflicts = self.annotated.add_annotations_from_arrays(labels,
+                                                               begins, ends)
+        assert conflicts == []
+        assert self.annotated.annotations == set(self.annotations)
+        self._check_standard_annotated_trajectory(self.annotated)
+
+    def test_add_annotations_from_arrays_conflicts(self):
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        conflicts = annotated.add_annotations_from_arrays(
+            labels=["2-digit", "x", "y", "z", "w"],
+            begins=[2, 0, 5, 5, 9],
+            ends=[3, 0, 5, 5, 9]
+        )
+        assert set(conflicts) == set([
+            AnnotationConflict(Annotation("2-digit", 2, 3),
+                               Annotation("1-digit", 1, 4)),
+            AnnotationConflict(Annotation("z", 5, 5),
+                               Annotation("y", 5, 5))
+        ])
+        # non-conflicting annotations are still added
+        assert annotated.get_label_for_frame(0) == "x"
+        assert annotated.get_label_for_frame(9) == "w"
+        assert annotated.get_label_for_frame(5) is None
+        assert annotated.get_label_for_frame(2) == "1-digit"
+        assert len(annotated.annotations) == 6
+        assert "y" not in annotated.state_names
+        assert "z" not in annotated.state_names
+
+    def test_add_annotations_from_arrays_all_pairs(self):
+        # b and c overlap each other, and both overlap a
+        conflicts = self.annotated.add_annotations_from_arrays(
+            labels=["a", "b", "c", "d"],
+            begins=[0, 1, 2, 11],
+            ends=[10, 3, 4, 12]
+        )
+        (a, b, c) = (Annotation("a", 0, 10), Annotation("b", 1, 3),
+                     Annotation("c", 2, 4))
+        assert len(conflicts) == 3
+        assert set(conflicts) == set([AnnotationConflict(b, a),
+                                      AnnotationConflict(c, a),
+                                      AnnotationConflict(c, b)])
+        assert self.annotated.annotations == set([Annotation("d", 11, 12)])
+
+    def test_add_annotations_from_arrays_bytes_labels(self):
+        labels = np.array([a.state.encode('utf-8')
+                           for a in self.annotations])
+        begins = [a.begin for a in self.annotations]
+        ends = [a.end for a in self.annotations]
+        conflicts = self.annotated.add_annotations_from_arrays(labels,
+                                                               begins, ends)
+        assert conflicts == []
+        self._check_standard_annotated_trajectory(self.annotated)
+
+    def test_add_annotations_from_arrays_bad_shape(self):
+        with pytest.raises(ValueError):
+            # a single string is not a list of labels
+            self.annotated.add_annotations_from_arrays("ab", [0, 2], [1, 3])
+        with pytest.raises(ValueError):
+            self.annotated.add_annotations_from_arrays(
+                [["a", "b"]], [[0, 2]], [[1, 3]]
+            )
+        assert self.annotated.annotations == set([])
+
+    def test_add_annotations_from_arrays_missing_labels(self):
+        labels = np.array(["a", None, float('nan'), "d"], dtype=object)
+        with pytest.raises(ValueError) as excinfo:
+            self.annotated.add_annotations_from_arrays(labels, [0, 2, 4, 6],
+                                                       [1, 3, 5, 7])
+        assert "[1, 2]" in str(excinfo.value)
+        assert self.annotated.annotations == set([])
+
+    def test_add_annotations_from_arrays_bad_range(self):
+        with pytest.raises(ValueError):
+            self.annotated.add_annotations_from_arrays(["a", "b"], [0, 3],
+                                                       [1, 2])
+        with pytest.raises(ValueError):
+            self.annotated.add_annotations_from_arrays(["a"], [0], [13])
+        assert self.annotated.annotations == set([])
+
+    @pytest.mark.parametrize('ext, delimiter', [('csv', ','),
+                                                ('tsv', '\t')])
+    def test_add_annotations_from_file(self, tmpdir, ext, delimiter):
+        filename = str(tmpdir.join("annotations." + ext))
+        with open(filename, 'w') as f:
+            f.write(delimiter.join(["state", "begin", "end"]) + "\n")
+            for annotation in self.annotations:
+                f.write(delimiter.join(str(v) for v in annotation) + "\n")
+        conflicts = self.annotated.add_annotations_from_file(filename)
+        assert conflicts == []
+        self._check_standard_annotated_trajectory(self.annotated)
+
+    @pytest.mark.parametrize('content', ["1-digit,1,4\n2-digit,6\n",
+                                         "state,begin\n1-digit,1,4\n",
+                                         "1-digit,1,4\n2-digit,6,x\n",
+                                         "1-digit,1,4,5\n"])
+    def test_add_annotations_from_file_bad_rows(self, tmpdir, content):
+        filename = str(tmpdir.join("annotations.csv"))
+        with open(filename, 'w') as f:
+            f.write(content)
+        with pytest.raises(ValueError) as excinfo:
+            self.annotated.add_annotations_from_file(filename)
+        assert "line" in str(excinfo.value)
+        assert self.annotated.annotations == set([])
+
     def test_get_segment_idxs(self):
         annotated = AnnotatedTrajectory(self.traj, self.annotations)
         idxs_1 = annotated.get_segment_idxs("1-digit")
@@ -157,6 +288,32 @@ class TestAnnotatedTrajectory(object):
             assert segments_2[1] == self.traj[11:13]
             assert segments_2[0] == self.traj[6:9]
 
+    def test_append_frames(self):
+        annotated = AnnotatedTrajectory(self.traj[:9], self.annotations[:2])
+        annotated.append_frames(self.traj[9:],
+                                self.annotations[2:])
+        assert len(annotated.trajectory) == 13
+        assert annotated.trajectory == self.traj
+        assert len(annotated.annotations) == 4
+        self._check_standard_annotated_trajectory(annotated)
+
+    def test_append_frames_bad_annotations(self):
+        annotated = AnnotatedTrajectory(self.traj[:9], self.annotations[:2])
+        bad_annotations = [
+            [self.annotation_3, Annotation("3-digit", 8, 9)],  # overlap
+            [self.annotation_3, Annotation("3-digit", 11, 13)],  # too long
+            [Annotation("3-digit", 9, 10), Annotation("2-digit", 10, 11)]
+        ]
+        for bad in bad_annotations:
+            with pytest.raises(ValueError):
+                annotated.append_frames(self.traj[9:], bad)
+            # nothing changed
+            assert annotated.trajectory == self.traj[:9]
+            assert len(annotated._frame_map) == 9
+            assert set(annotated.state_names) == set(["1-digit", "2-digit"])
+            assert annotated.annotations == set(self.annotations[:2])
+            assert annotated.get_label_for_frame(8) == "2-digit"
+
     def test_get_all_frames(self):
         annotated = AnnotatedTrajectory(self.traj, self.annotations)
         all_2 = annotated.get_all_frames("2-digit")
@@ -225,6 +382,205 @@ class TestAnnotatedTrajectory(object):
         with pytest.raises(RuntimeError):
             (results, conflicts) = annotated.validate_states(states)
 
+    def test_validate_states_incremental(self):
+        annotated = AnnotatedTrajectory(self.traj[:9], self.annotations[:2])
+        states = {name: CountingVolume(vol)
+                  for (name, vol) in self.states.items()
+                  if name != "3-digit"}
+        (results, conflicts) = annotated.validate_states(states,
+                                                         incremental=True)
+        assert results["2-digit"].false_positive == [self.traj[5]]
+        assert all(vol.n_calls == 9 for vol in states.values())
+
+        annotated.append_frames(self.traj[9:], self.annotations[2:])
+        annotated.add_annotations(Annotation(state="1-digit", begin=5,
+                                             end=5))
+        states["3-digit"] = CountingVolume(self.state_3)
+        (results, conflicts) = annotated.validate_states(states,
+                                                         incremental=True)
+        # old volumes are only evaluated on the 4 new frames
+        assert states["1-digit"].n_calls == 13
+        assert states["2-digit"].n_calls == 13
+        assert states["3-digit"].n_calls == 13
+
+        (expected, expected_conflicts) = annotated.validate_states(
+            self.states
+        )
+        assert results == expected
+        for state_name in expected_conflicts:
+            assert sorted(conflicts[state_name]) == \
+                    sorted(expected_conflicts[state_name])
+
+    def test_validate_states_incremental_new_volume(self):
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        annotated.validate_states(self.states, incremental=True)
+        # a different volume for the same label resets the cache
+        states = dict(self.states)
+        states["3-digit"] = paths.EmptyVolume()
+        (results, conflicts) = annotated.validate_states(states,
+                                                         incremental=True)
+        assert results["3-digit"].correct == []
+        assert results["3-digit"].false_negative == [self.traj[10]]
+
+    def test_validate_states_async(self):
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        job = annotated.validate_states_async(self.states)
+        (results, conflicts) = job.result(timeout=60)
+        assert job.done()
+        assert not job.cancelled()
+        assert job.progress == {name: (13, 13) for name in self.states}
+        (expected, expected_conflicts) = annotated.validate_states(
+            self.states
+        )
+        assert results == expected
+        assert conflicts == expected_conflicts
+        assert job.partial_results() == (results, conflicts)
+        assert not job.cancel()
+
+    def test_validate_states_async_await(self):
+        asyncio = pytest.importorskip("asyncio")
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        job = annotated.validate_states_async(self.states)
+        loop = asyncio.new_event_loop()
+        try:
+            (results, conflicts) = loop.run_until_complete(job)
+        finally:
+            loop.close()
+        (expected, _) = annotated.validate_states(self.states)
+        assert results == expected
+
+    def test_validate_states_async_await_cancelled(self):
+        asyncio = pytest.importorskip("asyncio")
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        states = dict(self.states)
+        states["1-digit"] = BlockingVolume(self.state_1)
+        job = annotated.validate_states_async(states)
+        loop = asyncio.new_event_loop()
+        try:
+            # abandoning the awaiting task doesn't cancel the job
+            with pytest.raises(asyncio.TimeoutError):
+                loop.run_until_complete(asyncio.wait_for(job, 0.01))
+        finally:
+            loop.close()
+        assert not job.done()
+        assert not job.cancelled()
+        states["1-digit"].release.set()
+        (results, _) = job.result(timeout=60)
+        (expected, _) = annotated.validate_states(self.states)
+        assert results == expected
+
+    def test_validate_states_async_cancel(self):
+        futures = pytest.importorskip("concurrent.futures")
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        states = dict(self.states)
+        # states are validated in sorted order; block on the last one
+        states["3-digit"] = BlockingVolume(self.state_3)
+        job = annotated.validate_states_async(states)
+        assert states["3-digit"].started.wait(60)
+        (partial, partial_conflicts) = job.partial_results()
+        assert set(partial.keys()) == set(["1-digit", "2-digit"])
+        assert job.progress["3-digit"] == (0, 13)
+        assert job.cancel()
+        # still running, so not cancelled yet
+        assert not job.cancelled()
+        states["3-digit"].release.set()
+        with pytest.raises(futures.CancelledError):
+            job.result(timeout=60)
+        assert job.done()
+        assert job.cancelled()
+        assert job.progress["3-digit"] == (1, 13)
+
+    def test_validate_states_async_annotate_while_running(self):
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        (expected, expected_conflicts) = annotated.validate_states(
+            self.states
+        )
+        states = dict(self.states)
+        # block on the first state, so no state is finished yet
+        states["1-digit"] = BlockingVolume(self.state_1)
+        job = annotated.validate_states_async(states)
+        assert states["1-digit"].started.wait(60)
+        # annotate existing and new frames while the job is running
+        annotated.add_annotations(Annotation("3-digit", 9, 9))
+        annotated.append_frames(make_1d_traj([50, 60]),
+                                [Annotation("2-digit", 13, 14)])
+        # replacing a volume in the caller's dict doesn't affect the job
+        states["3-digit"] = paths.EmptyVolume()
+        states["1-digit"].release.set()
+        (results, conflicts) = job.result(timeout=60)
+        assert results == expected
+        for state_name in expected_conflicts:
+            assert sorted(conflicts[state_name]) == \
+                    sorted(expected_conflicts[state_name])
+
+    def test_validate_states_async_error(self):
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        states = dict(self.states)
+        states["magic"] = paths.EmptyVolume()
+        with pytest.raises(RuntimeError):
+            annotated.validate_states_async(states)
+
+    def _check_sampled_exact(self, results):
+        # when every frame is sampled, the estimates must be exact
+        expected = {
+            "1-digit": (4, 0, 1),
+            "2-digit": (5, 1, 0),
+            "3-digit": (1, 1, 0)
+        }
+        n_frames = len(self.traj)
+        for state_name in expected:
+            estimates = (results[state_name].correct,
+                         results[state_name].false_positive,
+                         results[state_name].false_negative)
+            for (estimate, count) in zip(estimates, expected[state_name]):
+                assert estimate.rate == pytest.approx(float(count) / n_frames)
+                assert estimate.lower == pytest.approx(estimate.rate)
+                assert estimate.upper == pytest.approx(estimate.rate)
+            assert results[state_name].n_sampled == n_frames
+
+    def test_validate_states_sampled_full_budget(self):
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        annotated.add_annotations(Annotation(state="1-digit", begin=5,
+                                             end=5))
+        results = annotated.validate_states_sampled(
+            self.states, n_frames=len(self.traj), seed=1
+        )
+        self._check_sampled_exact(results)
+
+    def test_validate_states_sampled_budget(self):
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        results = annotated.validate_states_sampled(self.states,
+                                                    n_frames=4, seed=1)
+        for state_name in self.states:
+            # one frame from each of the 3 labels and the unassigned frames
+            assert results[state_name].n_sampled == 4
+            for estimate in results[state_name][:3]:
+                assert 0.0 <= estimate.lower <= estimate.rate
+                assert estimate.rate <= estimate.upper <= 1.0
+
+    def test_validate_states_sampled_precision(self):
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        annotated.add_annotations(Annotation(state="1-digit", begin=5,
+                                             end=5))
+        # unreachable precision forces refinement to every frame
+        results = annotated.validate_states_sampled(
+            self.states, n_frames=4, precision=1e-6, seed=1
+        )
+        self._check_sampled_exact(results)
+
+    def test_validate_states_sampled_errors(self):
+        annotated = AnnotatedTrajectory(self.traj, self.annotations)
+        with pytest.raises(ValueError):
+            annotated.validate_states_sampled(self.states)
+        with pytest.raises(ValueError):
+            annotated.validate_states_sampled(self.states, n_frames=4,
+                                              confidence=1.5)
+        for n_frames in [0, -1]:
+            with pytest.raises(ValueError):
+                annotated.validate_states_sampled(self.states,
+                                                  n_frames=n_frames,
+                                                  precision=1e-6)
+
     def test_store_and_reload(self):
         if os.path.isfile(data_filename("output.nc")):
             os.remove(data_filename("output.nc"))